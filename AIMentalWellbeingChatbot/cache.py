@@ -0,0 +1,96 @@
+from typing import List, Optional
+import hashlib
+import numpy as np
+import orjson
+import redis.asyncio as redis
+from config import Config
+
+# Shared Redis client, or None when Redis is not configured
+redis_client = redis.from_url(Config.REDIS_URL) if Config.USE_REDIS else None
+
+class ExactMatchCache:
+    """
+    Redis-backed cache of chatbot results keyed by the exact message and intent,
+    checked before the semantic cache.
+    """
+    def __init__(self, client: redis.Redis, ttl: int = Config.EXACT_CACHE_TTL):
+        self.client = client
+        self.ttl = ttl
+    
+    def _key(self, user_message: str, intent: Optional[str]) -> str:
+        digest = hashlib.sha256(f"{intent or ''}|{user_message}".encode()).hexdigest()
+        return f"chat:{digest}"
+    
+    async def get(self, user_message: str, intent: Optional[str]) -> Optional[dict]:
+        try:
+            cached = await self.client.get(self._key(user_message, intent))
+        except redis.RedisError:
+            # A cache outage should not fail the chat request
+            return None
+        return orjson.loads(cached) if cached is not None else None
+    
+    async def set(self, user_message: str, intent: Optional[str], result: dict):
+        try:
+            await self.client.setex(self._key(user_message, intent), self.ttl, orjson.dumps(result))
+        except redis.RedisError:
+            pass
+
+
+class SemanticCache:
+    """
+    Caches chatbot results keyed by the embedding of the user message, so
+    paraphrased repeats are answered without calling the LLM.
+    """
+    def __init__(
+        self,
+        dim: int,
+        threshold: float = Config.SEMANTIC_CACHE_THRESHOLD,
+        max_size: int = Config.SEMANTIC_CACHE_SIZE
+    ):
+        self.threshold = threshold
+        self.max_size = max_size
+        
+        # Preallocated (max_size, dim) matrix of L2-normalized message embeddings;
+        # row i belongs to entries[i]
+        self.embeddings = np.zeros((max_size, dim), dtype=np.float32)
+        self.entries: List[dict] = []
+        self.intents = np.empty(max_size, dtype=object)
+        
+        # Logical clock of the last hit per row, used for LRU eviction
+        self.last_used = np.zeros(max_size, dtype=np.int64)
+        self._clock = 0
+    
+    def lookup(self, embedding: np.ndarray, intent: Optional[str] = None) -> Optional[dict]:
+        if not self.entries:
+            return None
+        
+        # Rows and query are normalized, so the dot product is the cosine similarity
+        size = len(self.entries)
+        similarities = self.embeddings[:size] @ embedding
+        if intent is not None:
+            # Ignore entries cached under a different intent
+            similarities[self.intents[:size] != intent] = -np.inf
+        
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        
+        self._touch(best)
+        return self.entries[best]
+    
+    def add(self, embedding: np.ndarray, entry: dict):
+        if len(self.entries) < self.max_size:
+            slot = len(self.entries)
+            self.entries.append(entry)
+        else:
+            # Evict the least recently used entry
+            slot = int(np.argmin(self.last_used))
+            self.entries[slot] = entry
+        
+        self.embeddings[slot] = embedding
+        self.intents[slot] = entry["intent"]
+        self._touch(slot)
+    
+    def _touch(self, slot: int):
+        self._clock += 1
+        self.last_used[slot] = self._clock
\ No newline at end of file
@@ -1,26 +1,159 @@
-from langchain.chat_models import ChatOpenAI, AzureChatOpenAI
+from langchain_openai import ChatOpenAI, AzureChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
+from langchain.schema.output_parser import StrOutputParser
+from sentence_transformers import SentenceTransformer
 from config import Config
-import json
+from cache import ExactMatchCache, SemanticCache, redis_client
+from typing import AsyncIterator, Optional, Tuple
+import asyncio
+import httpx
+import numpy as np
+import orjson
+import re
+
+# LLMs frequently wrap JSON replies in markdown code fences
+CODE_FENCE_RE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+
+def parse_json(text: str):
+    text = text.strip()
+    match = CODE_FENCE_RE.match(text)
+    if match:
+        text = match.group(1)
+    return orjson.loads(text)
+
+INTENTS = ("emergency", "irrelevant", "qna")
+
+def is_number(value) -> bool:
+    # bool is an int subclass, but true/false is not a confidence
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+# Pulls the intent out of a combined reply that is not valid JSON
+INTENT_RE = re.compile(r'"intent"\s*:\s*"(emergency|irrelevant|qna)"')
+
+# Fields of a combined reply that is still streaming
+CONFIDENCE_RE = re.compile(r'"confidence"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)')
+RESPONSE_START_RE = re.compile(r'"response"\s*:\s*"')
+
+def parse_stream_header(text: str) -> Optional[dict]:
+    # None means the intent was not among the fields ahead of "response"
+    intent = INTENT_RE.search(text)
+    if intent is None:
+        return None
+    confidence = CONFIDENCE_RE.search(text)
+    return {
+        "intent": intent.group(1),
+        "confidence": float(confidence.group(1)) if confidence else 0.8
+    }
+
+def json_string_prefix(text: str, start: int) -> Tuple[int, bool]:
+    """
+    Scans the body of a JSON string from start. Returns the end of the part that
+    can be decoded without splitting an escape sequence, and whether the
+    closing quote was reached.
+    """
+    i = start
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            return i, True
+        if char == "\\":
+            if i + 1 >= len(text):
+                break
+            if text[i + 1] == "u":
+                # A high surrogate can only be decoded together with the escape after it
+                end = i + 6
+                if end <= len(text) and "d800" <= text[i + 2:end].lower() <= "dbff":
+                    end += 6
+                if end > len(text):
+                    break
+                i = end
+            else:
+                i += 2
+            continue
+        i += 1
+    return i, False
+
+def decode_json_string(body: str) -> str:
+    try:
+        return orjson.loads('"' + body + '"')
+    except orjson.JSONDecodeError:
+        # Unescaped control characters; pass the text through as is
+        return body
+
+# Crisis language that must always be routed to the emergency response
+EMERGENCY_RE = re.compile(
+    r"\b(suicid(e|al)|kill(ing)? (my|your)self|end(ing)? (my|your) life|self[- ]?harm"
+    r"|want(ed)? to die|hurt(ing)? (my|your)self)\b",
+    re.IGNORECASE
+)
 
 class WellnessChatbot:
     def __init__(self):
+        # Shared HTTP/2 connection pool so concurrent requests reuse kept-alive TLS connections
+        self.http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=Config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(Config.HTTP_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT)
+        )
+        
         if Config.USE_AZURE:
             self.llm = AzureChatOpenAI(
                 azure_endpoint=Config.AZURE_OPENAI_ENDPOINT,
                 openai_api_key=Config.AZURE_OPENAI_API_KEY,
                 deployment_name=Config.AZURE_OPENAI_DEPLOYMENT_NAME,
                 openai_api_version=Config.AZURE_OPENAI_API_VERSION,
-                temperature=0.7
+                temperature=0.7,
+                http_async_client=self.http_client
             )
         else:
             self.llm = ChatOpenAI(
                 openai_api_key=Config.OPENAI_API_KEY,
                 model_name="gpt-3.5-turbo",
-                temperature=0.7
+                temperature=0.7,
+                http_async_client=self.http_client
             )
         
+        # Local embedding model and semantic cache for paraphrased repeats
+        self.encoder = SentenceTransformer(Config.EMBEDDING_MODEL)
+        self.semantic_cache = SemanticCache(self.encoder.get_sentence_embedding_dimension())
+        
+        # Exact-match cache in Redis, checked before the semantic cache
+        self.exact_cache = ExactMatchCache(redis_client) if redis_client is not None else None
+        
+        # Combined prompt: classifies the intent and writes the reply in a single LLM call
+        self.combined_prompt = ChatPromptTemplate.from_template("""
+        You are a social and emotional wellness chatbot.
+        First classify the user's message into one of these categories, then reply in the style required for that category:
+        
+        1. "emergency": Messages indicating immediate danger, self-harm, suicide, or crisis situations
+           Reply as a compassionate crisis counselor: acknowledge their feelings, express care and concern,
+           and encourage immediate professional help. Always include these crisis resources:
+           - National Suicide Prevention Lifeline: 988 or 1-800-273-8255
+           - Crisis Text Line: Text HOME to 741741
+           - Emergency services: 911
+        2. "irrelevant": Messages not related to social and emotional wellness (e.g., technical questions, math, unrelated topics)
+           Politely redirect them to wellness-related topics such as stress management, emotional support,
+           relationship advice, mental health resources, and self-care strategies.
+        3. "qna": Messages related to social and emotional wellness, mental health, relationships, stress, anxiety, etc.
+           Be warm, empathetic, and non-judgmental. Provide practical advice and coping strategies, encourage
+           self-care and healthy habits, suggest professional help when appropriate, and use evidence-based approaches.
+        
+        User message: {user_message}
+        
+        Respond with only a JSON object containing:
+        - "intent": one of ["emergency", "irrelevant", "qna"]
+        - "confidence": a number between 0 and 1
+        - "response": your reply to the user
+        
+        Response:
+        """)
+        # JSON mode keeps the free-text reply from breaking the JSON; Azure's default API version predates it
+        json_llm = self.llm if Config.USE_AZURE else self.llm.bind(response_format={"type": "json_object"})
+        self.chain = self.combined_prompt | json_llm | StrOutputParser()
+        
         # Intent detection prompt
         self.intent_prompt = ChatPromptTemplate.from_template("""
         You are an intent classifier for a social and emotional wellness chatbot.
@@ -39,6 +172,7 @@ class WellnessChatbot:
         
         Response:
         """)
+        self.intent_chain = self.intent_prompt | self.llm | StrOutputParser()
         
         # Response generation prompts
         self.emergency_prompt = ChatPromptTemplate.from_template("""
@@ -59,6 +193,7 @@ class WellnessChatbot:
         
         Response:
         """)
+        self.emergency_chain = self.emergency_prompt | self.llm | StrOutputParser()
         
         self.wellness_prompt = ChatPromptTemplate.from_template("""
         You are a supportive social and emotional wellness assistant. Provide helpful, empathetic responses about mental health, emotions, relationships, and wellbeing.
@@ -74,6 +209,7 @@ class WellnessChatbot:
         
         Response:
         """)
+        self.wellness_chain = self.wellness_prompt | self.llm | StrOutputParser()
         
         self.irrelevant_prompt = ChatPromptTemplate.from_template("""
         The user has asked something outside the scope of social and emotional wellness support.
@@ -89,15 +225,46 @@ class WellnessChatbot:
         
         Response:
         """)
+        self.irrelevant_chain = self.irrelevant_prompt | self.llm | StrOutputParser()
+        
+        # Response chain per intent; anything unrecognized is treated as qna
+        self.response_chains = {
+            "emergency": self.emergency_chain,
+            "irrelevant": self.irrelevant_chain
+        }
+    
+    async def detect_intent(self, user_message: str) -> dict:
+        intent_data = self._detect_intent_locally(user_message)
+        if intent_data is not None:
+            return intent_data
+        
+        return await self._detect_intent_llm(user_message)
+    
+    def _detect_intent_locally(self, user_message: str) -> Optional[dict]:
+        # Crisis keywords short-circuit everything else, so they never wait on a model
+        if EMERGENCY_RE.search(user_message):
+            return {
+                "intent": "emergency",
+                "confidence": 1.0,
+                "reason": "Emergency keyword match"
+            }
+        
+        # None means the LLM has to decide
+        return None
     
-    def detect_intent(self, user_message: str) -> dict:
-        chain = LLMChain(llm=self.llm, prompt=self.intent_prompt)
-        response = chain.run(user_message=user_message)
+    async def _detect_intent_llm(self, user_message: str) -> dict:
+        response = await self.intent_chain.ainvoke({"user_message": user_message})
         
         try:
-            intent_data = json.loads(response)
-        except:
-            # Fallback if JSON parsing fails
+            intent_data = parse_json(response)
+            if (
+                not isinstance(intent_data, dict)
+                or intent_data.get("intent") not in INTENTS
+                or not is_number(intent_data.get("confidence", 0.8))
+            ):
+                raise ValueError("Expected an object with a known intent")
+        except ValueError:
+            # Fallback if JSON parsing fails or the reply has no usable intent
             intent_data = {
                 "intent": "qna",
                 "confidence": 0.5,
@@ -106,12 +273,173 @@ class WellnessChatbot:
         
         return intent_data
     
-    def generate_response(self, user_message: str, intent: str) -> str:
-        if intent == "emergency":
-            chain = LLMChain(llm=self.llm, prompt=self.emergency_prompt)
-        elif intent == "irrelevant":
-            chain = LLMChain(llm=self.llm, prompt=self.irrelevant_prompt)
-        else:  # qna
-            chain = LLMChain(llm=self.llm, prompt=self.wellness_prompt)
-        
-        return chain.run(user_message=user_message)
\ No newline at end of file
+    async def generate_response(self, user_message: str, intent: str) -> str:
+        chain = self.response_chains.get(intent, self.wellness_chain)
+        return await chain.ainvoke({"user_message": user_message})
+    
+    async def process(self, user_message: str) -> dict:
+        embedding = await self._embed(user_message)
+        
+        intent_data = self._detect_intent_locally(user_message)
+        intent = intent_data["intent"] if intent_data else None
+        
+        cached = await self._get_cached(user_message, embedding, intent)
+        if cached is not None:
+            return cached
+        
+        if intent_data is not None:
+            # Intent is already known, so only the reply needs an LLM call
+            result = {
+                "intent": intent,
+                "confidence": intent_data["confidence"],
+                "response": await self.generate_response(user_message, intent)
+            }
+        else:
+            response = await self.chain.ainvoke({"user_message": user_message})
+            
+            result = self._parse_combined(response)
+            if result is None:
+                # Fallback if the model did not return the expected JSON: regenerate the
+                # reply with the intent's own prompt
+                intent_data = await self._recover_intent(user_message, response)
+                detected_intent = intent_data.get("intent", "qna")
+                result = {
+                    "intent": detected_intent,
+                    "confidence": intent_data.get("confidence", 0.5),
+                    "response": await self.generate_response(user_message, detected_intent)
+                }
+        
+        await self._cache_result(user_message, embedding, intent, result)
+        return result
+    
+    def _parse_combined(self, response: str) -> Optional[dict]:
+        # None means the reply is not an object with a known intent, a numeric confidence and a text response
+        try:
+            data = parse_json(response)
+        except ValueError:
+            return None
+        if (
+            not isinstance(data, dict)
+            or data.get("intent") not in INTENTS
+            or not is_number(data.get("confidence", 0.8))
+            or not isinstance(data.get("response"), str)
+        ):
+            return None
+        return {
+            "intent": data["intent"],
+            "confidence": data.get("confidence", 0.8),
+            "response": data["response"]
+        }
+    
+    async def _recover_intent(self, user_message: str, response: str) -> dict:
+        # Keep the intent from a malformed combined reply when it can be read
+        match = INTENT_RE.search(response)
+        if match:
+            return {"intent": match.group(1), "confidence": 0.5}
+        return await self._detect_intent_llm(user_message)
+    
+    async def stream(self, user_message: str) -> AsyncIterator[dict]:
+        """
+        Yields an event with the intent and confidence first, then the reply
+        in chunks as the LLM produces them.
+        """
+        embedding = await self._embed(user_message)
+        
+        intent_data = self._detect_intent_locally(user_message)
+        intent = intent_data["intent"] if intent_data else None
+        
+        cached = await self._get_cached(user_message, embedding, intent)
+        if cached is not None:
+            yield {"intent": cached["intent"], "confidence": cached["confidence"]}
+            yield {"token": cached["response"]}
+            return
+        
+        if intent_data is not None:
+            events = self._stream_reply(user_message, intent_data)
+        else:
+            events = self._stream_combined(user_message)
+        
+        header = None
+        chunks = []
+        async for event in events:
+            if "token" in event:
+                chunks.append(event["token"])
+            else:
+                header = event
+            yield event
+        
+        result = {
+            "intent": header["intent"],
+            "confidence": header["confidence"],
+            "response": "".join(chunks)
+        }
+        await self._cache_result(user_message, embedding, intent, result)
+    
+    async def _stream_reply(self, user_message: str, intent_data: dict) -> AsyncIterator[dict]:
+        detected_intent = intent_data.get("intent", "qna")
+        yield {"intent": detected_intent, "confidence": intent_data.get("confidence", 0.8)}
+        
+        chain = self.response_chains.get(detected_intent, self.wellness_chain)
+        async for chunk in chain.astream({"user_message": user_message}):
+            yield {"token": chunk}
+    
+    async def _stream_combined(self, user_message: str) -> AsyncIterator[dict]:
+        # Streams the combined prompt in a single LLM call: the intent is read from the
+        # fields ahead of "response", then the response string is decoded as it arrives
+        buffer = ""
+        position = None
+        async for chunk in self.chain.astream({"user_message": user_message}):
+            buffer += chunk
+            if position is None:
+                match = RESPONSE_START_RE.search(buffer)
+                if match is None:
+                    continue
+                header = parse_stream_header(buffer[:match.start()])
+                if header is None:
+                    # Fields out of order; wait for the whole reply and parse it instead
+                    continue
+                yield header
+                position = match.end()
+            
+            end, closed = json_string_prefix(buffer, position)
+            if end > position:
+                yield {"token": decode_json_string(buffer[position:end])}
+                position = end
+            if closed:
+                return
+        
+        if position is not None:
+            # The reply was cut off inside the response string; keep what was forwarded
+            return
+        
+        result = self._parse_combined(buffer)
+        if result is not None:
+            yield {"intent": result["intent"], "confidence": result["confidence"]}
+            yield {"token": result["response"]}
+            return
+        
+        async for event in self._stream_reply(user_message, await self._recover_intent(user_message, buffer)):
+            yield event
+    
+    async def _embed(self, user_message: str) -> np.ndarray:
+        # Model inference is CPU-bound, so run it off the event loop
+        return await asyncio.to_thread(self.encoder.encode, user_message, normalize_embeddings=True)
+    
+    async def _get_cached(self, user_message: str, embedding: np.ndarray, intent: Optional[str]) -> Optional[dict]:
+        # Exact repeats are answered from Redis
+        if self.exact_cache is not None:
+            cached = await self.exact_cache.get(user_message, intent)
+            if cached is not None:
+                return cached
+        
+        # Only reuse cached replies for the same intent as a keyword match
+        return self.semantic_cache.lookup(embedding, intent=intent)
+    
+    async def _cache_result(self, user_message: str, embedding: np.ndarray, intent: Optional[str], result: dict):
+        self.semantic_cache.add(embedding, result)
+        if self.exact_cache is not None:
+            # Keyed by the pre-LLM intent so the same message maps to the same key next time
+            await self.exact_cache.set(user_message, intent, result)
+    
+    async def aclose(self):
+        await self.http_client.aclose()
\ No newline at end of file
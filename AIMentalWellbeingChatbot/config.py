@@ -18,4 +18,26 @@ class Config:
     AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2023-05-15")
     
     # Use Azure OpenAI if configured, otherwise use OpenAI
-    USE_AZURE = bool(AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT)
\ No newline at end of file
+    USE_AZURE = bool(AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT)
+    
+    # Semantic cache configuration
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+    
+    # Redis configuration (optional); enables the exact-match response cache and shared chat history
+    REDIS_URL = os.getenv("REDIS_URL")
+    USE_REDIS = bool(REDIS_URL)
+    EXACT_CACHE_TTL = int(os.getenv("EXACT_CACHE_TTL", "3600"))
+    
+    # HTTP connection pool shared by all LLM requests
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "100"))
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    
+    # Messages kept per user in the chat history
+    CHAT_HISTORY_SIZE = int(os.getenv("CHAT_HISTORY_SIZE", "100"))
+    
+    # Uvicorn worker processes; more than one needs Redis so history is shared between them
+    WORKERS = int(os.getenv("WORKERS", "4" if USE_REDIS else "1"))
\ No newline at end of file
@@ -0,0 +1,58 @@
+from collections import defaultdict, deque
+from typing import Deque, Dict, List
+import logging
+import orjson
+import redis.asyncio as redis
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class InMemoryChatHistory:
+    """
+    Chat history kept in this process, used when Redis is not configured.
+    """
+    def __init__(self, max_size: int = Config.CHAT_HISTORY_SIZE):
+        # Bounded per user, so the oldest message is dropped on append
+        self.sessions: Dict[str, Deque[dict]] = defaultdict(lambda: deque(maxlen=max_size))
+    
+    async def append(self, user: str, entry: dict):
+        self.sessions[user].append(entry)
+    
+    async def get(self, user: str, limit: int) -> List[dict]:
+        history = self.sessions.get(user, ())
+        return list(history)[-limit:]
+    
+    async def clear(self, user: str):
+        if user in self.sessions:
+            self.sessions[user].clear()
+
+
+class RedisChatHistory:
+    """
+    Chat history in one Redis list per user, newest first, shared by all workers.
+    """
+    def __init__(self, client: redis.Redis, max_size: int = Config.CHAT_HISTORY_SIZE):
+        self.client = client
+        self.max_size = max_size
+    
+    def _key(self, user: str) -> str:
+        return f"hist:{user}"
+    
+    async def append(self, user: str, entry: dict):
+        # Push and trim atomically in one round trip, keeping only the newest max_size entries
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.lpush(self._key(user), orjson.dumps(entry))
+                pipe.ltrim(self._key(user), 0, self.max_size - 1)
+                await pipe.execute()
+        except redis.RedisError:
+            # The reply is already generated, so a Redis outage only loses this history entry
+            logger.warning("Could not save chat history for %s", user, exc_info=True)
+    
+    async def get(self, user: str, limit: int) -> List[dict]:
+        entries = await self.client.lrange(self._key(user), 0, limit - 1)
+        # Stored newest first; returned oldest first like the in-memory history
+        return [orjson.loads(entry) for entry in reversed(entries)]
+    
+    async def clear(self, user: str):
+        await self.client.delete(self._key(user))
\ No newline at end of file
